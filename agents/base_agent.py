@@ -1,32 +1,85 @@
 # agents/base_agent.py
 from abc import ABC, abstractmethod
+from typing import List
+import hashlib
+import re
+import msgspec
 from models.state import ProjectState, AgentInput, AgentRole
 from services.openai_service import OpenAIService
 
+def content_key(data: bytes) -> str:
+    """Short content hash for cache keys"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+# Strict JSON schema every specialist answers with (OpenAI structured outputs)
+AGENT_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "analysis": {"type": "string"},
+        "recommendation": {"type": "string", "enum": ["Modify Existing Nanobodies", "De Novo Design"]},
+        "confidence": {"type": "number"},
+        "reasoning": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["analysis", "recommendation", "confidence", "reasoning"],
+    "additionalProperties": False
+}
+
+# Heuristic fallback patterns - case-insensitive so responses aren't lowercased per call
+_CONF_RE = re.compile(r'confidence[:\s]*([0-9.]+)', re.IGNORECASE)
+_DE_NOVO_RE = re.compile(r'de\s+novo', re.IGNORECASE)
+_BULLETS = ('- ', '* ', '• ')
+
+class AgentAnalysis(msgspec.Struct):
+    analysis: str
+    recommendation: str
+    confidence: float
+    reasoning: List[str]
+
 class BaseAgent(ABC):
+    # str.format template with {expertise}, {text} and {previous_inputs} placeholders
+    _PROMPT_TEMPLATE: str = ""
+    
     def __init__(self, openai_service: OpenAIService, role: AgentRole):
         self.openai_service = openai_service
         self.role = role
         self.expertise = self._define_expertise()
+        # Expertise is fixed per agent, so bake it in once
+        self._prompt_template = self._PROMPT_TEMPLATE.replace("{expertise}", self.expertise)
     
     @abstractmethod
     def _define_expertise(self) -> str:
         """Define this agent's area of expertise"""
         pass
     
-    @abstractmethod
     def _get_analysis_prompt(self, state: ProjectState) -> str:
         """Generate the prompt for this agent's analysis"""
-        pass
+        # Empty during the team meeting - experts give independent assessments
+        previous_inputs = state.render_prior_inputs() or "None yet - give your independent assessment."
+        return self._prompt_template.format(text=state.text, previous_inputs=previous_inputs)
     
     async def provide_input(self, state: ProjectState) -> AgentInput:
         """Standard method all agents use to provide input"""
+        if not self._PROMPT_TEMPLATE:
+            # e.g. the PI, which synthesizes rather than contributing an analysis
+            raise NotImplementedError(f"{self.role.value} does not provide team input")
         prompt = self._get_analysis_prompt(state)
         
-        response = await self.openai_service.chat_completion(prompt)
+        # Scoped to this exact brief: the embedding model truncates long prompts and can't
+        # tell numbers apart, so a brief differing only in target, budget or timeline
+        # would otherwise be answered with another brief's analysis
+        response = await self.openai_service.chat_completion_structured(
+            prompt, AGENT_ANALYSIS_SCHEMA, "AgentAnalysis",
+            cache_scope=f"{self.role.value}:{content_key(state.text.encode())}"
+        )
         
-        # Parse structured response
-        analysis, recommendation, confidence, reasoning = self._parse_response(response)
+        try:
+            result = msgspec.json.decode(response, type=AgentAnalysis)
+            analysis, recommendation, confidence, reasoning = (
+                result.analysis, result.recommendation, result.confidence, result.reasoning
+            )
+        except msgspec.DecodeError:
+            # Output cut off at max_tokens is not valid JSON - salvage what we can
+            analysis, recommendation, confidence, reasoning = self._parse_response(response)
         
         return AgentInput(
             agent=self.role,
@@ -37,24 +90,24 @@ class BaseAgent(ABC):
         )
     
     def _parse_response(self, response: str) -> tuple:
-        """Parse agent response into structured components"""
-        # Simple parsing - in production could use structured outputs
-        lines = response.strip().split('\n')
-        
+        """Heuristic parse of a free-text (or truncated) agent response"""
         analysis = response  # Full response as analysis
         
         # Extract recommendation
-        if "de novo" in response.lower():
+        if _DE_NOVO_RE.search(response):
             recommendation = "De Novo Design"
         else:
             recommendation = "Modify Existing Nanobodies"
             
         # Extract confidence (look for numbers like 0.8, 80%, etc.)
-        import re
-        conf_match = re.search(r'confidence[:\s]*([0-9.]+)', response.lower())
+        conf_match = _CONF_RE.search(response)
         confidence = float(conf_match.group(1)) if conf_match else 0.7
         
-        # Extract reasoning points
-        reasoning = [line.strip('- ') for line in lines if line.strip().startswith('- ')]
+        # Extract reasoning points (-, * or • bullets) with a single lstrip per line
+        reasoning = []
+        for line in response.splitlines():
+            stripped = line.lstrip()
+            if stripped.startswith(_BULLETS):
+                reasoning.append(stripped[2:].rstrip())
         
         return analysis, recommendation, confidence, reasoning
\ No newline at end of file
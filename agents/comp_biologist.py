@@ -1,24 +1,13 @@
 # agents/comp_biologist.py
 from agents.base_agent import BaseAgent
-from models.state import AgentRole, ProjectState
+from models.state import AgentRole
 
 class CompBiologistAgent(BaseAgent):
-    def __init__(self, openai_service):
-        super().__init__(openai_service, AgentRole.COMP_BIOLOGIST)
-    
-    def _define_expertise(self) -> str:
-        return "protein design workflows, molecular dynamics, Rosetta, experimental validation"
-    
-    def _get_analysis_prompt(self, state: ProjectState) -> str:
-        previous_inputs = "\n".join([
-            f"{inp.agent}: {inp.analysis}" for inp in state.agent_inputs
-        ])
-        
-        return f"""
-        You are a Computational Biologist with expertise in {self.expertise}.
+    _PROMPT_TEMPLATE = """
+        You are a Computational Biologist with expertise in {expertise}.
         
         PROJECT BRIEF:
-        {state.text}
+        {text}
         
         PREVIOUS TEAM DISCUSSION:
         {previous_inputs}
@@ -30,4 +19,10 @@ class CompBiologistAgent(BaseAgent):
         4. Your recommendation: "Modify Existing Nanobodies" or "De Novo Design"
         
         Focus on practical implementation and what's actually achievable.
-        """
\ No newline at end of file
+        """
+    
+    def __init__(self, openai_service):
+        super().__init__(openai_service, AgentRole.COMP_BIOLOGIST)
+    
+    def _define_expertise(self) -> str:
+        return "protein design workflows, molecular dynamics, Rosetta, experimental validation"
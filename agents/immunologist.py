@@ -1,25 +1,14 @@
 # agents/immunologist.py
 from agents.base_agent import BaseAgent
-from models.state import AgentRole, ProjectState
+from models.state import AgentRole
 
 
 class ImmunologistAgent(BaseAgent):
-    def __init__(self, openai_service):
-        super().__init__(openai_service, AgentRole.IMMUNOLOGIST)
-    
-    def _define_expertise(self) -> str:
-        return "antibody biology, immune responses, target druggability, nanobody engineering"
-    
-    def _get_analysis_prompt(self, state: ProjectState) -> str:
-        previous_inputs = "\n".join([
-            f"{inp.agent}: {inp.analysis}" for inp in state.agent_inputs
-        ])
-        
-        return f"""
-        You are an Immunologist with expertise in {self.expertise}.
+    _PROMPT_TEMPLATE = """
+        You are an Immunologist with expertise in {expertise}.
         
         PROJECT BRIEF:
-        {state.text}
+        {text}
         
         PREVIOUS TEAM DISCUSSION:
         {previous_inputs}
@@ -36,3 +25,9 @@ class ImmunologistAgent(BaseAgent):
         - Confidence level (0.0-1.0)
         - Key considerations for the team
         """
+    
+    def __init__(self, openai_service):
+        super().__init__(openai_service, AgentRole.IMMUNOLOGIST)
+    
+    def _define_expertise(self) -> str:
+        return "antibody biology, immune responses, target druggability, nanobody engineering"
@@ -1,24 +1,13 @@
 # agents/ml_specialist.py  
 from agents.base_agent import BaseAgent
-from models.state import AgentRole, ProjectState
+from models.state import AgentRole
 
 class MLSpecialistAgent(BaseAgent):
-    def __init__(self, openai_service):
-        super().__init__(openai_service, AgentRole.ML_SPECIALIST)
-    
-    def _define_expertise(self) -> str:
-        return "protein language models (ESM), structure prediction (AlphaFold), computational protein design"
-    
-    def _get_analysis_prompt(self, state: ProjectState) -> str:
-        previous_inputs = "\n".join([
-            f"{inp.agent}: {inp.analysis}" for inp in state.agent_inputs
-        ])
-        
-        return f"""
-        You are an ML Specialist with expertise in {self.expertise}.
+    _PROMPT_TEMPLATE = """
+        You are an ML Specialist with expertise in {expertise}.
         
         PROJECT BRIEF:
-        {state.text}
+        {text}
         
         PREVIOUS TEAM DISCUSSION:
         {previous_inputs}
@@ -31,3 +20,9 @@ class MLSpecialistAgent(BaseAgent):
         
         Consider that modification requires existing scaffolds while de novo needs more compute.
         """
+    
+    def __init__(self, openai_service):
+        super().__init__(openai_service, AgentRole.ML_SPECIALIST)
+    
+    def _define_expertise(self) -> str:
+        return "protein language models (ESM), structure prediction (AlphaFold), computational protein design"
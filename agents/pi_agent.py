@@ -1,25 +1,162 @@
 # agents/pi_agent.py
-from agents.base_agent import BaseAgent
-from models.state import AgentRole, ProjectState, AgentInput
-from typing import Dict, Any
+from agents.base_agent import BaseAgent, content_key
+from models.state import AgentRole, ProjectState
+from typing import Dict, Any, AsyncIterator, Callable, List, Optional, Type, TypeVar
+from collections import Counter
+from cachetools import TTLCache
+import logging
+import ijson
+import msgspec
+
+logger = logging.getLogger(__name__)
+
+# "<stage>_retry" / "<stage>_fallback" counts - surfaced on /health so prompt regressions show up
+parse_failures: Counter = Counter()
+
+_JSON_ONLY_SUFFIX = "\n\nReturn ONLY the JSON object, no surrounding text."
+
+class ExtractedData(msgspec.Struct):
+    """Shape of the PI's brief extraction"""
+    target: str
+    timeline: str
+    budget: str
+    goal: str
+    confidence: float = 0.8
+
+class StrategyResult(msgspec.Struct):
+    """Shape of the PI's synthesized strategy"""
+    title: str
+    rationale: List[Dict[str, Any]]
+    candidates: List[str] = []
+    confidence: float = 0.7
+    alternatives: List[Dict[str, Any]] = []
+
+# Strict JSON schemas for the PI's structured outputs
+EXTRACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "target": {"type": "string"},
+        "timeline": {"type": "string"},
+        "budget": {"type": "string"},
+        "goal": {"type": "string"},
+        "confidence": {"type": "number"}
+    },
+    "required": ["target", "timeline", "budget", "goal", "confidence"],
+    "additionalProperties": False
+}
+
+STRATEGY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string", "enum": ["Modify Existing Nanobodies", "De Novo Design"]},
+        "rationale": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "icon": {"type": "string"},
+                    "label": {"type": "string"},
+                    "description": {"type": "string"}
+                },
+                "required": ["icon", "label", "description"],
+                "additionalProperties": False
+            }
+        },
+        "candidates": {"type": "array", "items": {"type": "string"}},
+        "confidence": {"type": "number"},
+        "alternatives": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "title": {"type": "string"},
+                    "why": {"type": "string"}
+                },
+                "required": ["title", "why"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["title", "rationale", "candidates", "confidence", "alternatives"],
+    "additionalProperties": False
+}
+
+T = TypeVar("T", bound=msgspec.Struct)
+
+def _decode_json(response: str, struct_type: Type[T]) -> Dict[str, Any]:
+    """Parse and validate the JSON object in an LLM response in one pass"""
+    # Tolerate prose or markdown fences around the object
+    start, end = response.find("{"), response.rfind("}")
+    if start == -1 or end < start:
+        raise msgspec.DecodeError("No JSON object in response")
+    # strict=False lets numeric strings like "0.9" through as floats
+    decoded = msgspec.json.decode(response[start:end + 1], type=struct_type, strict=False)
+    return msgspec.to_builtins(decoded)
+
+class _DeltaReader:
+    """Async file-like view over streamed completion deltas, for ijson"""
+    
+    def __init__(self, deltas: AsyncIterator[str]):
+        self._deltas = deltas
+        self._pending = b""  # Bytes of the current delta not yet handed out
+    
+    async def read(self, size: int = -1) -> bytes:
+        if size == 0:
+            return b""  # ijson probes with read(0) to tell bytes from str - don't consume a delta
+        while not self._pending:
+            delta = await anext(self._deltas, None)
+            if delta is None:
+                return b""
+            self._pending = delta.encode()
+        if size < 0 or size >= len(self._pending):
+            chunk, self._pending = self._pending, b""
+        else:
+            chunk, self._pending = self._pending[:size], self._pending[size:]
+        return chunk
+
+# Briefs shorter than this carry nothing to extract - don't pay for an LLM call
+MIN_BRIEF_LENGTH = 50
+
+_UNSPECIFIED_EXTRACTION = {
+    "target": "unspecified",
+    "timeline": "unspecified",
+    "budget": "unspecified",
+    "goal": "unspecified",
+    "confidence": 0.3
+}
+
+# Used when strategy synthesis can't be parsed even after a re-prompt - treat as read-only
+FALLBACK_STRATEGY = {
+    "title": "Modify Existing Nanobodies",
+    "rationale": [
+        {"icon": "Clock", "label": "Team Analysis", "description": "Based on team discussion"},
+        {"icon": "TrendingUp", "label": "Consensus", "description": "Team reached agreement"}, 
+        {"icon": "DollarSign", "label": "Feasible", "description": "Within project constraints"}
+    ],
+    "candidates": ["Ty1", "H11-D4", "Nb21", "VHH-72"],
+    "confidence": 0.7,
+    "alternatives": []
+}
 
 class PIAgent(BaseAgent):
     def __init__(self, openai_service):
         super().__init__(openai_service, AgentRole.PI)
+        # Brief hash -> extracted data; the same brief is re-sent between phases and on re-upload
+        self._extract_cache: "TTLCache[str, Dict[str, Any]]" = TTLCache(maxsize=1000, ttl=86400)
     
     def _define_expertise(self) -> str:
         return "project management, strategic decision making, team synthesis"
     
-    def _get_analysis_prompt(self, state: ProjectState) -> str:
-        # PI doesn't use the standard analysis prompt
-        pass
-    
-    async def provide_input(self, state: ProjectState) -> AgentInput:
-        # PI doesn't provide input like other agents
-        pass
-    
     async def extract_key_data(self, text: str) -> Dict[str, Any]:
         """Extract structured data for API response"""
+        if len(text.strip()) < MIN_BRIEF_LENGTH:
+            return dict(_UNSPECIFIED_EXTRACTION)
+        
+        key = content_key(text.encode())
+        cached = self._extract_cache.get(key)
+        if cached is not None:
+            return dict(cached)
+        
         prompt = f"""
         Extract key project data from this brief:
         
@@ -29,13 +166,8 @@ class PIAgent(BaseAgent):
         {{"target": "specific target protein/antigen", "timeline": "duration", "budget": "amount", "goal": "objective", "confidence": 0.9}}
         """
         
-        response = await self.openai_service.chat_completion(prompt)
-        
-        # Parse JSON
-        import json
-        try:
-            return json.loads(response.strip())
-        except:
+        extracted = await self._request_json(prompt, EXTRACTION_SCHEMA, ExtractedData, "extract")
+        if extracted is None:
             # Fallback extraction
             return {
                 "target": "Extracted target",
@@ -44,13 +176,22 @@ class PIAgent(BaseAgent):
                 "goal": "Extracted goal",
                 "confidence": 0.8
             }
+        
+        # Only real extractions are cached - a failed parse should be retried next time
+        self._extract_cache[key] = extracted
+        return dict(extracted)
     
-    async def synthesize_strategy(self, state: ProjectState) -> Dict[str, Any]:
-        """Synthesize team input into final strategy recommendation"""
-        team_summary = "\n".join([
-            f"{inp.agent} (confidence {inp.confidence}): {inp.recommendation}\nReasoning: {inp.analysis}"
+    async def synthesize_strategy(self, state: ProjectState,
+                                  on_field: Optional[Callable[[str, Any], None]] = None) -> Dict[str, Any]:
+        """
+        Synthesize team input into final strategy recommendation
+        The response is streamed; on_field(key, value) fires as each top-level field closes,
+        and again for any field the final (retried or fallback) strategy changed
+        """
+        team_summary = "\n".join(
+            f"{inp.agent.value} (confidence {inp.confidence}): {inp.recommendation}\nReasoning: {inp.analysis}"
             for inp in state.agent_inputs
-        ])
+        )
         
         prompt = f"""
         As Principal Investigator, synthesize your team's input into a final strategy recommendation.
@@ -77,21 +218,69 @@ class PIAgent(BaseAgent):
         Consider team consensus and weigh expert opinions appropriately.
         """
         
-        response = await self.openai_service.chat_completion(prompt)
+        streamed: Dict[str, Any] = {}
+        def record_field(key: str, value: Any):
+            streamed[key] = value
+            on_field(key, value)
         
-        import json
+        strategy = await self._stream_json(
+            prompt, STRATEGY_SCHEMA, StrategyResult, "strategy", record_field if on_field else None
+        )
+        if strategy is None:
+            strategy = dict(FALLBACK_STRATEGY)
+        if on_field:
+            # Streamed fields may come from an attempt that then failed validation -
+            # re-send whatever the retry/fallback changed so the client ends consistent
+            for key, value in strategy.items():
+                if key not in streamed or streamed[key] != value:
+                    on_field(key, value)
+        return strategy
+    
+    async def _request_json(self, prompt: str, schema: Dict[str, Any], struct_type: Type[T],
+                            stage: str) -> Optional[Dict[str, Any]]:
+        """Request schema-constrained JSON, re-prompting once before giving up"""
+        # No semantic cache for the PI: the embedding model truncates long prompts and
+        # can't tell numbers apart, so a similar brief would get another brief's budget
+        # or timeline. Exact repeats are covered by the brief-hash caches instead.
+        response = await self.openai_service.chat_completion_structured(
+            prompt, schema, struct_type.__name__, use_cache=False
+        )
         try:
-            return json.loads(response.strip())
-        except:
-            # Fallback strategy
-            return {
-                "title": "Modify Existing Nanobodies",
-                "rationale": [
-                    {"icon": "Clock", "label": "Team Analysis", "description": "Based on team discussion"},
-                    {"icon": "TrendingUp", "label": "Consensus", "description": "Team reached agreement"}, 
-                    {"icon": "DollarSign", "label": "Feasible", "description": "Within project constraints"}
-                ],
-                "candidates": ["Ty1", "H11-D4", "Nb21", "VHH-72"],
-                "confidence": 0.7,
-                "alternatives": []
-            }
\ No newline at end of file
+            return _decode_json(response, struct_type)
+        except msgspec.DecodeError as e:
+            parse_failures[f"{stage}_retry"] += 1
+            logger.warning("PI %s response did not parse (%s) - re-prompting", stage, e)
+        return await self._retry_json(prompt, schema, struct_type, stage)
+    
+    async def _stream_json(self, prompt: str, schema: Dict[str, Any], struct_type: Type[T], stage: str,
+                           on_field: Optional[Callable[[str, Any], None]]) -> Optional[Dict[str, Any]]:
+        """Like _request_json, but parses the object incrementally as it streams in"""
+        # Uncached for the same reason as _request_json
+        deltas = self.openai_service.chat_completion_stream(prompt, schema, struct_type.__name__, use_cache=False)
+        fields = {}
+        try:
+            async for key, value in ijson.kvitems_async(_DeltaReader(deltas), "", use_float=True):
+                fields[key] = value
+                if on_field:
+                    on_field(key, value)
+            return msgspec.to_builtins(msgspec.convert(fields, type=struct_type, strict=False))
+        except (ijson.JSONError, msgspec.DecodeError) as e:
+            parse_failures[f"{stage}_retry"] += 1
+            logger.warning("PI %s stream did not parse (%s) - re-prompting", stage, e)
+        finally:
+            await deltas.aclose()  # Release the connection if parsing stopped early
+        return await self._retry_json(prompt, schema, struct_type, stage)
+    
+    async def _retry_json(self, prompt: str, schema: Dict[str, Any], struct_type: Type[T],
+                          stage: str) -> Optional[Dict[str, Any]]:
+        """Re-prompt once for bare JSON - None means use the fallback"""
+        # Uncached, like the first attempt
+        response = await self.openai_service.chat_completion_structured(
+            prompt + _JSON_ONLY_SUFFIX, schema, struct_type.__name__, use_cache=False
+        )
+        try:
+            return _decode_json(response, struct_type)
+        except msgspec.DecodeError as e:
+            parse_failures[f"{stage}_fallback"] += 1
+            logger.warning("PI %s retry did not parse (%s) - using fallback", stage, e)
+            return None
@@ -1,12 +1,119 @@
-# agents/virtual_lab.py - FIXED VERSION
-from models.state import ProjectState, AgentRole, ProgressEvent, EventType
-from agents.pi_agent import PIAgent
+# agents/virtual_lab.py
+from models.state import ProjectState, AgentRole, AgentInput, EventType
+from agents.base_agent import BaseAgent, content_key
+from agents.pi_agent import PIAgent, FALLBACK_STRATEGY
 from agents.immunologist import ImmunologistAgent  
 from agents.ml_specialist import MLSpecialistAgent
 from agents.comp_biologist import CompBiologistAgent
 from services.openai_service import OpenAIService
-from typing import Dict, Any, List
-from datetime import datetime
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
+from contextvars import ContextVar
+from dataclasses import asdict
+from datetime import datetime, timezone
+import asyncio
+import orjson
+from cachetools import TTLCache
+
+# Per-run state lives in context variables so one VirtualLab can serve
+# concurrent requests. Tasks copy the context when created, so a value set
+# before `asyncio.create_task` follows that run (and its agent subtasks).
+progress_callback_var: ContextVar[Optional[Callable[[Dict[str, Any]], None]]] = ContextVar(
+    "progress_callback", default=None
+)
+_events_var: ContextVar[List[Dict[str, Any]]] = ContextVar("events")
+
+# Per-agent progress copy: (thinking step, thinking message, complete step, complete message)
+_TEAM_STEPS = {
+    AgentRole.IMMUNOLOGIST: (
+        "Immunological Analysis",
+        "Analyzing antigen properties, epitope mapping, and binding requirements...",
+        "Immunological Analysis Complete",
+        "Immunological assessment complete - recommendations documented",
+    ),
+    AgentRole.ML_SPECIALIST: (
+        "Machine Learning Analysis",
+        "Evaluating ML approaches, model selection, and data requirements...",
+        "ML Analysis Complete",
+        "ML strategy and computational approach defined",
+    ),
+    AgentRole.COMP_BIOLOGIST: (
+        "Computational Biology Analysis",
+        "Performing structural analysis, sequence optimization, and modeling...",
+        "Computational Biology Complete",
+        "Structural insights and sequence recommendations ready",
+    ),
+}
+
+# Common workflow steps (MVP - hardcoded for now). Shared by every response,
+# so treat as read-only.
+_WORKFLOW_STEPS = [
+    {
+        "id": "fetch_candidates",
+        "name": "Fetch Candidate Sequences",
+        "description": "Retrieve nanobody sequences from PDB database",
+        "required": True,
+        "selected": True,
+        "estimated_time": "2 hours",
+        "estimated_cost": "$0"
+    },
+    {
+        "id": "filter_candidates",
+        "name": "Filter Candidates",
+        "description": "Apply sequence and structural filters",
+        "required": True,
+        "selected": True,
+        "estimated_time": "1 hour",
+        "estimated_cost": "$0"
+    },
+    {
+        "id": "run_esm",
+        "name": "ESM Affinity Prediction",
+        "description": "Run ESM language model for binding affinity prediction",
+        "required": False,
+        "selected": True,
+        "estimated_time": "4 hours",
+        "estimated_cost": "$50",
+        "rounds": 2
+    },
+    {
+        "id": "run_alphafold",
+        "name": "AlphaFold3 Structural Prediction",
+        "description": "Generate 3D structures for top candidates",
+        "required": False,
+        "selected": True,
+        "estimated_time": "8 hours",
+        "estimated_cost": "$200"
+    },
+    {
+        "id": "affinity_maturation",
+        "name": "In Silico Affinity Maturation",
+        "description": "Optimize binding through computational mutation",
+        "required": False,
+        "selected": True,
+        "estimated_time": "12 hours",
+        "estimated_cost": "$100"
+    },
+    {
+        "id": "in_vitro_testing",
+        "name": "In Vitro Validation",
+        "description": "Experimental binding assays (requires lab work)",
+        "required": False,
+        "selected": False,  # Default off due to cost
+        "estimated_time": "2 weeks",
+        "estimated_cost": "$15,000"
+    }
+]
+
+# Total cost of the steps selected by default
+_DEFAULT_TOTAL_COST = sum(
+    int(s["estimated_cost"].replace("$", "").replace(",", ""))
+    for s in _WORKFLOW_STEPS if s["selected"]
+)
+_DEFAULT_TOTAL_COST_STR = f"${_DEFAULT_TOTAL_COST:,}"
+
+def _insight(agent_input: AgentInput) -> Dict[str, Any]:
+    """JSON-safe view of an agent's input, for progress events and results"""
+    return {**asdict(agent_input), "agent": agent_input.agent.value}
 
 class VirtualLab:
     def __init__(self, openai_service: OpenAIService, progress_callback=None):
@@ -14,32 +121,62 @@ class VirtualLab:
         self.immunologist = ImmunologistAgent(openai_service)
         self.ml_specialist = MLSpecialistAgent(openai_service)
         self.comp_biologist = CompBiologistAgent(openai_service)
-        self.progress_callback = progress_callback
-        self.events = []  # Stores dicts, not objects
+        self.progress_callback = progress_callback  # Fallback when progress_callback_var is unset
+        # (brief hash, confirmed parameters hash) -> finished analysis (minus events); read-only
+        self._analysis_cache: "TTLCache[Tuple[str, str], Dict[str, Any]]" = TTLCache(maxsize=1000, ttl=86400)
     
     def emit_event(self, event_type: EventType, step_name: str, progress: float, 
-                   message: str = "", agent_role: AgentRole = None):
+                   message: str = "", agent_role: AgentRole = None, details: Dict[str, Any] = None):
         """
         Emit progress event - stores as dict immediately (JSON-safe)
         No serialization issues!
         """
         event_dict = {
             "event_type": event_type.value,  # Convert enum to string immediately
-            "timestamp": datetime.utcnow().isoformat(),  # Convert datetime to ISO string immediately
+            "timestamp": datetime.now(timezone.utc).isoformat(),  # Convert datetime to ISO string immediately
             "step_name": step_name,
             "agent_role": agent_role.value if agent_role else None,  # Convert enum to string
             "progress": progress,
-            "message": message
+            "message": message,
+            "details": details  # Partial results streamed ahead of the final response
         }
         
-        self.events.append(event_dict)
+        _events_var.get().append(event_dict)
         
-        if self.progress_callback:
-            self.progress_callback(event_dict)
+        callback = progress_callback_var.get() or self.progress_callback
+        if callback:
+            callback(event_dict)
     
     def get_events(self) -> List[Dict[str, Any]]:
-        """Get all events - already JSON-safe dicts"""
-        return self.events
+        """Get this run's events - already JSON-safe dicts"""
+        return _events_var.get([])
+
+    async def _consult(self, agent: BaseAgent, state: ProjectState,
+                       progress: Iterator[float]) -> Tuple[AgentInput, Dict[str, Any]]:
+        """Get one expert's input, streaming it out as soon as it lands"""
+        agent_input = await agent.provide_input(state)
+        insight = _insight(agent_input)
+        complete_step, complete_message = _TEAM_STEPS[agent.role][2:]
+        self.emit_event(
+            event_type=EventType.STEP_COMPLETE,
+            step_name=complete_step,
+            progress=next(progress),
+            message=complete_message,
+            agent_role=agent.role,
+            details={"insight": insight}
+        )
+        return agent_input, insight
+
+    def _emit_strategy_field(self, key: str, value: Any):
+        """Push each strategy field to the client as soon as the PI has written it"""
+        self.emit_event(
+            event_type=EventType.DECISION_MADE,
+            step_name="Strategy Synthesis",
+            progress=80.0,
+            message=f"PI decided strategy {key}",
+            agent_role=AgentRole.PI,
+            details={"field": key, "value": value}
+        )
 
     async def analyze_brief(self, text: str) -> Dict[str, Any]:
         """
@@ -47,7 +184,7 @@ class VirtualLab:
         Returns extracted data for user confirmation
         """
         try:
-            self.events = []  # Reset events for new session
+            _events_var.set([])  # Reset events for new session
             
             self.emit_event(
                 event_type=EventType.STEP_START,
@@ -95,7 +232,23 @@ class VirtualLab:
         Returns strategy + workflow options for Checkpoint 2
         """
         try:
-            self.events = []  # Reset for Phase 2
+            _events_var.set([])  # Reset for Phase 2
+            
+            # Same brief confirmed with the same parameters - reuse the team's work
+            cache_key = (
+                content_key(text.encode()),
+                content_key(orjson.dumps(confirmed_data, option=orjson.OPT_SORT_KEYS))
+            )
+            cached = self._analysis_cache.get(cache_key)
+            if cached is not None:
+                self.emit_event(
+                    event_type=EventType.STEP_COMPLETE,
+                    step_name="Analysis Complete",
+                    progress=100.0,
+                    message="This brief was already analysed with these parameters - reusing the team's analysis",
+                    agent_role=AgentRole.PI
+                )
+                return {**cached, "progress_events": self.get_events()}
             
             # Initialize state
             state = ProjectState(text=text)
@@ -119,65 +272,32 @@ class VirtualLab:
                 agent_role=AgentRole.PI
             )
             
-            # Immunologist Analysis
-            self.emit_event(
-                event_type=EventType.AGENT_THINKING,
-                step_name="Immunological Analysis",
-                progress=15.0,
-                message="Analyzing antigen properties, epitope mapping, and binding requirements...",
-                agent_role=AgentRole.IMMUNOLOGIST
-            )
-            
-            immunologist_input = await self.immunologist.provide_input(state)
-            state.agent_inputs.append(immunologist_input)
-            
-            self.emit_event(
-                event_type=EventType.STEP_COMPLETE,
-                step_name="Immunological Analysis Complete",
-                progress=30.0,
-                message="Immunological assessment complete - recommendations documented",
-                agent_role=AgentRole.IMMUNOLOGIST
-            )
-            
-            # ML Specialist Analysis
-            self.emit_event(
-                event_type=EventType.AGENT_THINKING,
-                step_name="Machine Learning Analysis",
-                progress=35.0,
-                message="Evaluating ML approaches, model selection, and data requirements...",
-                agent_role=AgentRole.ML_SPECIALIST
-            )
-            
-            ml_input = await self.ml_specialist.provide_input(state)
-            state.agent_inputs.append(ml_input)
-            
-            self.emit_event(
-                event_type=EventType.STEP_COMPLETE,
-                step_name="ML Analysis Complete",
-                progress=50.0,
-                message="ML strategy and computational approach defined",
-                agent_role=AgentRole.ML_SPECIALIST
-            )
-            
-            # Computational Biologist Analysis
-            self.emit_event(
-                event_type=EventType.AGENT_THINKING,
-                step_name="Computational Biology Analysis",
-                progress=55.0,
-                message="Performing structural analysis, sequence optimization, and modeling...",
-                agent_role=AgentRole.COMP_BIOLOGIST
-            )
+            # Team meeting - experts opine independently, so consult them concurrently
+            team = [self.immunologist, self.ml_specialist, self.comp_biologist]
+            for agent in team:
+                thinking_step, thinking_message = _TEAM_STEPS[agent.role][:2]
+                self.emit_event(
+                    event_type=EventType.AGENT_THINKING,
+                    step_name=thinking_step,
+                    progress=15.0,
+                    message=thinking_message,
+                    agent_role=agent.role
+                )
             
-            comp_bio_input = await self.comp_biologist.provide_input(state)
-            state.agent_inputs.append(comp_bio_input)
-            
-            self.emit_event(
-                event_type=EventType.STEP_COMPLETE,
-                step_name="Computational Biology Complete",
-                progress=70.0,
-                message="Structural insights and sequence recommendations ready",
-                agent_role=AgentRole.COMP_BIOLOGIST
-            )
+            # TaskGroup cancels the other experts as soon as one fails, rather than
+            # letting gather leave them running (and billing) for a discarded result
+            completion_progress = iter((30.0, 50.0, 70.0))
+            try:
+                async with asyncio.TaskGroup() as consults:
+                    tasks = [
+                        consults.create_task(self._consult(agent, state, completion_progress))
+                        for agent in team
+                    ]
+            except ExceptionGroup as group:
+                raise group.exceptions[0] from None  # Surface the first failure as before
+            results = [task.result() for task in tasks]
+            state.agent_inputs.extend(agent_input for agent_input, _ in results)
+            immunologist_insight, ml_insight, comp_bio_insight = (insight for _, insight in results)
             
             # PI Strategy Synthesis
             self.emit_event(
@@ -188,7 +308,7 @@ class VirtualLab:
                 agent_role=AgentRole.PI
             )
             
-            strategy = await self.pi.synthesize_strategy(state)
+            strategy = await self.pi.synthesize_strategy(state, on_field=self._emit_strategy_field)
             
             self.emit_event(
                 event_type=EventType.STEP_COMPLETE,
@@ -217,19 +337,21 @@ class VirtualLab:
                 agent_role=AgentRole.PI
             )
             
-            return {
+            result = {
                 "extracted_data": confirmed_data,
                 "strategy": strategy,
                 "workflow_options": workflow_options,
                 "agent_insights": {
-                    "immunologist": immunologist_input,
-                    "ml_specialist": ml_input,
-                    "comp_biologist": comp_bio_input
+                    "immunologist": immunologist_insight,
+                    "ml_specialist": ml_insight,
+                    "comp_biologist": comp_bio_insight
                 },
                 "status": "awaiting_workflow_selection",
                 "checkpoint": "workflow_selection",
-                "progress_events": self.get_events(),
             }
+            if strategy != FALLBACK_STRATEGY:  # Don't pin a degraded answer for a day
+                self._analysis_cache[cache_key] = result
+            return {**result, "progress_events": self.get_events()}
             
         except Exception as e:
             self.emit_event(
@@ -254,75 +376,10 @@ class VirtualLab:
         # Extract strategy type to determine workflow
         strategy_type = strategy.get("title", "").lower()
         
-        # Define common workflow steps (MVP - hardcoded for now)
-        workflow_steps = [
-            {
-                "id": "fetch_candidates",
-                "name": "Fetch Candidate Sequences",
-                "description": "Retrieve nanobody sequences from PDB database",
-                "required": True,
-                "selected": True,
-                "estimated_time": "2 hours",
-                "estimated_cost": "$0"
-            },
-            {
-                "id": "filter_candidates",
-                "name": "Filter Candidates",
-                "description": "Apply sequence and structural filters",
-                "required": True,
-                "selected": True,
-                "estimated_time": "1 hour",
-                "estimated_cost": "$0"
-            },
-            {
-                "id": "run_esm",
-                "name": "ESM Affinity Prediction",
-                "description": "Run ESM language model for binding affinity prediction",
-                "required": False,
-                "selected": True,
-                "estimated_time": "4 hours",
-                "estimated_cost": "$50",
-                "rounds": 2
-            },
-            {
-                "id": "run_alphafold",
-                "name": "AlphaFold3 Structural Prediction",
-                "description": "Generate 3D structures for top candidates",
-                "required": False,
-                "selected": True,
-                "estimated_time": "8 hours",
-                "estimated_cost": "$200"
-            },
-            {
-                "id": "affinity_maturation",
-                "name": "In Silico Affinity Maturation",
-                "description": "Optimize binding through computational mutation",
-                "required": False,
-                "selected": True,
-                "estimated_time": "12 hours",
-                "estimated_cost": "$100"
-            },
-            {
-                "id": "in_vitro_testing",
-                "name": "In Vitro Validation",
-                "description": "Experimental binding assays (requires lab work)",
-                "required": False,
-                "selected": False,  # Default off due to cost
-                "estimated_time": "2 weeks",
-                "estimated_cost": "$15,000"
-            }
-        ]
-        
-        # Calculate totals
-        selected_steps = [s for s in workflow_steps if s["selected"]]
-        total_cost = sum(
-            int(s.get("estimated_cost", "$0").replace("$", "").replace(",", ""))
-            for s in selected_steps
-        )
-        
+        # Steps and their default total are static - built once at import
         return {
-            "steps": workflow_steps,
-            "total_estimated_cost": f"${total_cost:,}",
+            "steps": _WORKFLOW_STEPS,
+            "total_estimated_cost": _DEFAULT_TOTAL_COST_STR,
             "total_estimated_time": "~1 week (computational only)",
             "budget_available": confirmed_data.get("budget", "Unknown"),
             "constraints": {
@@ -1,15 +1,16 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
 from .routes import upload
+from agents.pi_agent import parse_failures
 
 
-app = FastAPI(title="AI Virtual Lab API", version="1.0.0")
+app = FastAPI(title="AI Virtual Lab API", version="1.0.0", default_response_class=ORJSONResponse)
 
 # CORS setup for frontend
 app.add_middleware(
@@ -23,14 +24,24 @@ app.add_middleware(
 # Include routers
 app.include_router(upload.router, prefix="/api", tags=["upload"])
 
+@app.on_event("shutdown")
+async def shutdown():
+    await upload.openai_service.aclose()
+    await upload.session_store.aclose()
+
 @app.get("/")
 async def root():
     return {"message": "AI Virtual Lab API is running"}
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "openai_configured": bool(os.getenv("OPENAI_API_KEY"))}
+    return {
+        "status": "healthy",
+        "openai_configured": bool(os.getenv("OPENAI_API_KEY")),
+        "pi_parse_failures": dict(parse_failures)
+    }
 
 if __name__ == "__main__":
+    # Production: uvicorn app.main:app --loop uvloop --http httptools
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True, loop="uvloop", http="httptools")
\ No newline at end of file
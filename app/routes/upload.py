@@ -1,25 +1,117 @@
 # routes/upload.py - WITH SSE SUPPORT
 from fastapi import APIRouter, UploadFile, File, HTTPException, Body
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 import uuid
-from datetime import datetime
-from typing import Dict, Any, List, Optional
-import json
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, Any, List, Optional
+import orjson
 import asyncio
+import threading
 
 from services.file_parser import FileParser
 from services.openai_service import OpenAIService
-from agents.virtual_lab import VirtualLab
+from services.semantic_cache import SemanticCache
+from services.session_store import SessionStore
+from services.event_log import EventLog
+from agents.virtual_lab import VirtualLab, progress_callback_var
+from agents.pi_agent import MIN_BRIEF_LENGTH
 import os
 
-router = APIRouter()
+# Declared here too so the routes serialize with orjson wherever the router is mounted
+router = APIRouter(default_response_class=ORJSONResponse)
 
 # Initialize services
-openai_service = OpenAIService(os.getenv("OPENAI_API_KEY"))
+openai_service = OpenAIService(
+    os.getenv("OPENAI_API_KEY"),
+    semantic_cache=SemanticCache(persist_path=os.getenv("SEMANTIC_CACHE_PATH", "semantic_cache.json"))
+)
+# Shared across requests - per-run events and callbacks are context-local
+virtual_lab = VirtualLab(openai_service)
 
-# In-memory storage (replace with database in production)
-project_sessions = {}
+# Idle SSE streams get a comment frame this often so proxies/CDNs don't time them out
+_SSE_PING_INTERVAL = 15.0
+_SSE_PING = b": ping\n\n"
+
+async def _event_batches(queue: asyncio.Queue) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Yield queued events in bursts; a None on the queue ends the stream.
+    A lone event goes out at once, and whatever queued up while the previous
+    frame was being written shares the next one. An empty batch means the
+    stream has been idle for _SSE_PING_INTERVAL.
+    """
+    while True:
+        try:
+            event = await asyncio.wait_for(queue.get(), _SSE_PING_INTERVAL)
+        except asyncio.TimeoutError:
+            yield []
+            continue
+        if event is None:
+            return
+        batch = [event]
+        while not queue.empty():
+            event = queue.get_nowait()
+            if event is None:
+                yield batch
+                return
+            batch.append(event)
+        yield batch
+
+class _UuidPool:
+    """Random (v4) UUID strings cut from a 4 KiB urandom buffer - one syscall per 256 ids"""
+    
+    _BUFFER_SIZE = 4096
+    
+    def __init__(self):
+        self._reset()
+        # A forked worker must not hand out the ids left in its parent's buffer
+        os.register_at_fork(after_in_child=self._reset)
+    
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._refill()
+    
+    def _refill(self):
+        self._buffer = os.urandom(self._BUFFER_SIZE)
+        self._offset = 0
+    
+    def next_id(self) -> str:
+        with self._lock:
+            if self._offset == self._BUFFER_SIZE:
+                self._refill()
+            raw = self._buffer[self._offset:self._offset + 16]
+            self._offset += 16
+        # version=4 sets the RFC 4122 version and variant bits
+        return str(uuid.UUID(bytes=raw, version=4))
+
+_project_ids = _UuidPool()
+
+_ALLOWED_EXTS = frozenset({"pdf", "docx", "txt"})
+_ALLOWED_MSG = "pdf, docx, txt"
+
+_SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no"  # Disable nginx buffering
+}
+
+# Redis-backed when SESSION_STORE_URL is set, in-memory otherwise
+session_store = SessionStore(os.getenv("SESSION_STORE_URL"))
+
+async def _get_session(project_id: str) -> Dict[str, Any]:
+    session = await session_store.get(project_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    return session
+
+# Full progress traces go to disk; sessions keep only the last few events
+event_log = EventLog(os.getenv("EVENT_LOG_DIR", "event_logs"), ttl=session_store.ttl)
+_EVENTS_TAIL = 10
+
+async def _record_events(session: Dict[str, Any], checkpoint: str, events: List[Dict[str, Any]]):
+    await asyncio.to_thread(event_log.append, session["project_id"], checkpoint, events)
+    session[f"{checkpoint}_events_tail"] = events[-_EVENTS_TAIL:]
+    session[f"{checkpoint}_events_count"] = len(events)
 
 class ConfirmDataRequest(BaseModel):
     """Request body for confirming extracted data (Checkpoint 1)"""
@@ -45,26 +137,24 @@ async def upload_file(file: UploadFile = File(...)):
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file uploaded")
     
-    allowed_types = ['pdf', 'docx', 'txt']
-    file_ext = file.filename.split('.')[-1].lower()
+    file_ext = file.filename.rpartition('.')[2].lower()
     
-    if file_ext not in allowed_types:
+    if file_ext not in _ALLOWED_EXTS:
         raise HTTPException(
             status_code=400, 
-            detail=f"File type '{file_ext}' not supported. Use: {', '.join(allowed_types)}"
+            detail=f"File type '{file_ext}' not supported. Use: {_ALLOWED_MSG}"
         )
     
     try:
-        # Read and parse file
-        file_content = await file.read()
-        text_content = FileParser.parse_file(file_content, file.filename)
+        # Starlette has already spooled the upload (to disk past 1 MB);
+        # parse straight from that file instead of reading it into bytes
+        await file.seek(0)
+        # PDF/DOCX parsing is CPU bound - keep it off the event loop
+        text_content = await asyncio.to_thread(FileParser.parse_file, file.file, file.filename)
         
-        if len(text_content.strip()) < 50:
+        if len(text_content.strip()) < MIN_BRIEF_LENGTH:
             raise HTTPException(status_code=400, detail="File appears to be empty or too short")
         
-        # Create VirtualLab instance
-        virtual_lab = VirtualLab(openai_service, None)
-        
         # PHASE 1: Quick extraction only
         result = await virtual_lab.analyze_brief(text_content)
         
@@ -72,19 +162,21 @@ async def upload_file(file: UploadFile = File(...)):
             raise HTTPException(status_code=500, detail=result.get("error", "Unknown error"))
         
         # Create project session
-        project_id = str(uuid.uuid4())
-        project_sessions[project_id] = {
+        project_id = _project_ids.next_id()
+        now = datetime.now(timezone.utc).isoformat()
+        session = {
             "project_id": project_id,
             "filename": file.filename,
             "original_text": text_content,
             "extracted_data": result["extracted_data"],
             "phase": "checkpoint_1",
-            "checkpoint_1_events": result["progress_events"],
-            "created_at": datetime.utcnow().isoformat(),
-            "updated_at": datetime.utcnow().isoformat()
+            "created_at": now,
+            "updated_at": now
         }
+        await _record_events(session, "checkpoint_1", result["progress_events"])
+        await session_store.set(project_id, session)
         
-        return JSONResponse({
+        return {
             "success": True,
             "project_id": project_id,
             "filename": file.filename,
@@ -93,8 +185,8 @@ async def upload_file(file: UploadFile = File(...)):
             "checkpoint": result["checkpoint"],
             "progress_events": result["progress_events"],
             "message": "Please confirm: Did I understand your project correctly?",
-            "processed_at": datetime.utcnow().isoformat()
-        })
+            "processed_at": now
+        }
         
     except HTTPException:
         raise
@@ -108,11 +200,7 @@ async def confirm_understanding_stream(request: ConfirmDataRequest):
     Returns SSE stream of progress events, then final result
     """
     
-    # Validate project exists
-    if request.project_id not in project_sessions:
-        raise HTTPException(status_code=404, detail="Project not found")
-    
-    session = project_sessions[request.project_id]
+    session = await _get_session(request.project_id)
     
     # Validate we're at the right checkpoint
     if session["phase"] != "checkpoint_1":
@@ -122,54 +210,45 @@ async def confirm_understanding_stream(request: ConfirmDataRequest):
         )
     
     async def event_generator():
-        """Generate SSE events as analysis progresses"""
+        """Generate SSE payloads as analysis progresses"""
         
         try:
             # Update session
             session["confirmed_data"] = request.confirmed_data
             session["user_modified_extraction"] = request.user_modified
-            session["checkpoint_1_confirmed_at"] = datetime.utcnow().isoformat()
-            
-            # Store events as they're emitted
-            all_events = []
+            session["checkpoint_1_confirmed_at"] = datetime.now(timezone.utc).isoformat()
             
-            def progress_callback(event_dict):
-                """Called by VirtualLab when event occurs"""
-                all_events.append(event_dict)
+            # VirtualLab pushes events straight onto the queue; None marks the end
+            queue: asyncio.Queue = asyncio.Queue()
             
-            # Create VirtualLab with callback
-            virtual_lab_streaming = VirtualLab(openai_service, progress_callback)
-            
-            # Start analysis in background, yield events as they come
-            analysis_task = asyncio.create_task(
-                virtual_lab_streaming.generate_full_analysis(
-                    text=session["original_text"],
-                    confirmed_data=request.confirmed_data
+            # Start analysis in background, yield events as they come. The task
+            # copies the context on creation, so it keeps this run's callback
+            token = progress_callback_var.set(queue.put_nowait)
+            try:
+                analysis_task = asyncio.create_task(
+                    virtual_lab.generate_full_analysis(
+                        text=session["original_text"],
+                        confirmed_data=request.confirmed_data
+                    )
                 )
-            )
+            finally:
+                progress_callback_var.reset(token)
+            analysis_task.add_done_callback(lambda _: queue.put_nowait(None))
             
-            # Stream events as they're added to all_events
-            last_event_count = 0
-            while not analysis_task.done():
-                # Check for new events
-                if len(all_events) > last_event_count:
-                    # Send new events
-                    for event in all_events[last_event_count:]:
-                        yield f"data: {json.dumps({'type': 'progress', 'event': event})}\n\n"
-                    last_event_count = len(all_events)
-                
-                await asyncio.sleep(0.1)  # Check every 100ms
+            # Forward events as they're emitted - bursts share a frame
+            async for batch in _event_batches(queue):
+                if not batch:
+                    yield None  # Keep-alive
+                elif len(batch) == 1:
+                    yield {'type': 'progress', 'event': batch[0]}
+                else:
+                    yield {'type': 'progress_batch', 'events': batch}
             
             # Get final result
             analysis_result = await analysis_task
             
-            # Send any remaining events
-            if len(all_events) > last_event_count:
-                for event in all_events[last_event_count:]:
-                    yield f"data: {json.dumps({'type': 'progress', 'event': event})}\n\n"
-            
             if analysis_result["status"] == "error":
-                yield f"data: {json.dumps({'type': 'error', 'error': analysis_result.get('error', 'Unknown error')})}\n\n"
+                yield {'type': 'error', 'error': analysis_result.get('error', 'Unknown error')}
                 return
             
             # Update session with results
@@ -177,8 +256,10 @@ async def confirm_understanding_stream(request: ConfirmDataRequest):
             session["workflow_options"] = analysis_result["workflow_options"]
             session["agent_insights"] = analysis_result["agent_insights"]
             session["phase"] = "checkpoint_2"
-            session["checkpoint_2_events"] = analysis_result["progress_events"]
-            session["updated_at"] = datetime.utcnow().isoformat()
+            session.pop("original_text", None)  # Consumed by the analysis; the report never shows it
+            await _record_events(session, "checkpoint_2", analysis_result["progress_events"])
+            session["updated_at"] = datetime.now(timezone.utc).isoformat()
+            await session_store.set(request.project_id, session)
             
             # Send final complete event with full result
             final_response = {
@@ -195,23 +276,23 @@ async def confirm_understanding_stream(request: ConfirmDataRequest):
                 }
             }
             
-            yield f"data: {json.dumps(final_response)}\n\n"
+            yield final_response
             
         except Exception as e:
             error_event = {
                 "type": "error",
                 "error": str(e)
             }
-            yield f"data: {json.dumps(error_event)}\n\n"
+            yield error_event
     
     return StreamingResponse(
-        event_generator(),
+        # orjson emits bytes directly - no str formatting or re-encode per frame
+        (
+            _SSE_PING if payload is None else b"data: " + orjson.dumps(payload) + b"\n\n"
+            async for payload in event_generator()
+        ),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"  # Disable nginx buffering
-        }
+        headers=_SSE_HEADERS
     )
 
 @router.post("/confirm-understanding")
@@ -221,11 +302,7 @@ async def confirm_understanding(request: ConfirmDataRequest):
     Returns complete result after all processing is done
     """
     
-    # Validate project exists
-    if request.project_id not in project_sessions:
-        raise HTTPException(status_code=404, detail="Project not found")
-    
-    session = project_sessions[request.project_id]
+    session = await _get_session(request.project_id)
     
     if session["phase"] != "checkpoint_1":
         raise HTTPException(
@@ -236,10 +313,7 @@ async def confirm_understanding(request: ConfirmDataRequest):
     try:
         session["confirmed_data"] = request.confirmed_data
         session["user_modified_extraction"] = request.user_modified
-        session["checkpoint_1_confirmed_at"] = datetime.utcnow().isoformat()
-        
-        # Create VirtualLab without streaming
-        virtual_lab = VirtualLab(openai_service, None)
+        session["checkpoint_1_confirmed_at"] = datetime.now(timezone.utc).isoformat()
         
         # Run full analysis
         analysis_result = await virtual_lab.generate_full_analysis(
@@ -255,10 +329,13 @@ async def confirm_understanding(request: ConfirmDataRequest):
         session["workflow_options"] = analysis_result["workflow_options"]
         session["agent_insights"] = analysis_result["agent_insights"]
         session["phase"] = "checkpoint_2"
-        session["checkpoint_2_events"] = analysis_result["progress_events"]
-        session["updated_at"] = datetime.utcnow().isoformat()
+        session.pop("original_text", None)  # Consumed by the analysis; the report never shows it
+        await _record_events(session, "checkpoint_2", analysis_result["progress_events"])
+        now = datetime.now(timezone.utc).isoformat()
+        session["updated_at"] = now
+        await session_store.set(request.project_id, session)
         
-        return JSONResponse({
+        return {
             "success": True,
             "project_id": request.project_id,
             "extracted_data": analysis_result["extracted_data"],
@@ -268,8 +345,8 @@ async def confirm_understanding(request: ConfirmDataRequest):
             "checkpoint": analysis_result["checkpoint"],
             "progress_events": analysis_result["progress_events"],
             "message": "Analysis complete! Please review the workflow options.",
-            "processed_at": datetime.utcnow().isoformat()
-        })
+            "processed_at": now
+        }
         
     except HTTPException:
         raise
@@ -283,10 +360,7 @@ async def finalize_workflow(request: WorkflowSelectionRequest):
     Saves everything for User 2 to review
     """
     
-    if request.project_id not in project_sessions:
-        raise HTTPException(status_code=404, detail="Project not found")
-    
-    session = project_sessions[request.project_id]
+    session = await _get_session(request.project_id)
     
     if session["phase"] != "checkpoint_2":
         raise HTTPException(
@@ -299,22 +373,25 @@ async def finalize_workflow(request: WorkflowSelectionRequest):
         "modifications": request.modifications,
         "user_notes": request.user_notes
     }
+    now = datetime.now(timezone.utc).isoformat()
     session["phase"] = "finalized"
-    session["finalized_at"] = datetime.utcnow().isoformat()
-    session["updated_at"] = datetime.utcnow().isoformat()
+    session["finalized_at"] = now
+    session["updated_at"] = now
+    await session_store.set(request.project_id, session)
+    await asyncio.to_thread(event_log.touch, request.project_id)  # Trace lives as long as the session
     
     all_steps = session["workflow_options"]["steps"]
     final_workflow = [step for step in all_steps if step["id"] in request.selected_steps]
     
-    return JSONResponse({
+    return {
         "success": True,
         "project_id": request.project_id,
         "status": "finalized",
         "message": "Workflow finalized and ready to share with team",
         "final_workflow": final_workflow,
         "share_url": f"/api/report/{request.project_id}",
-        "finalized_at": datetime.utcnow().isoformat()
-    })
+        "finalized_at": now
+    }
 
 @router.get("/report/{project_id}")
 async def get_full_report(project_id: str):
@@ -322,22 +399,21 @@ async def get_full_report(project_id: str):
     USER 2 VIEW: Complete audit trail and decision history
     """
     
-    if project_id not in project_sessions:
-        raise HTTPException(status_code=404, detail="Project not found")
-    
-    session = project_sessions[project_id]
+    session = await _get_session(project_id)
     
     report = {
         "project_id": project_id,
         "filename": session["filename"],
         "created_at": session["created_at"],
         "finalized_at": session.get("finalized_at"),
+        "events_url": f"/api/events/{project_id}",
         
         "checkpoint_1": {
             "original_extraction": session["extracted_data"],
             "user_confirmed_data": session.get("confirmed_data", session["extracted_data"]),
             "user_modified": session.get("user_modified_extraction", False),
-            "progress_events": session.get("checkpoint_1_events", [])
+            "progress_events": session.get("checkpoint_1_events_tail", []),
+            "progress_event_count": session.get("checkpoint_1_events_count", 0)
         },
         
         "checkpoint_2": {
@@ -345,7 +421,8 @@ async def get_full_report(project_id: str):
             "agent_insights": session.get("agent_insights", {}),
             "workflow_options_presented": session.get("workflow_options", {}),
             "user_selections": session.get("final_workflow_selections", {}),
-            "progress_events": session.get("checkpoint_2_events", [])
+            "progress_events": session.get("checkpoint_2_events_tail", []),
+            "progress_event_count": session.get("checkpoint_2_events_count", 0)
         },
         
         "timeline": {
@@ -357,18 +434,15 @@ async def get_full_report(project_id: str):
         "status": session["phase"]
     }
     
-    return JSONResponse(report)
+    return report
 
 @router.get("/project/{project_id}/status")
 async def get_project_status(project_id: str):
     """Quick status check"""
     
-    if project_id not in project_sessions:
-        raise HTTPException(status_code=404, detail="Project not found")
-    
-    session = project_sessions[project_id]
+    session = await _get_session(project_id)
     
-    return JSONResponse({
+    return {
         "project_id": project_id,
         "phase": session["phase"],
         "updated_at": session["updated_at"],
@@ -376,4 +450,13 @@ async def get_project_status(project_id: str):
             "checkpoint_1_complete": "checkpoint_1_confirmed_at" in session,
             "checkpoint_2_complete": "finalized_at" in session
         }
-    })
\ No newline at end of file
+    }
+
+@router.get("/events/{project_id}")
+async def get_project_events(project_id: str):
+    """Full progress trace for both checkpoints, streamed as NDJSON"""
+    
+    await _get_session(project_id)
+    
+    # Sync iterator - Starlette reads the file in its threadpool
+    return StreamingResponse(event_log.iter_lines(project_id), media_type="application/x-ndjson")
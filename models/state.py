@@ -1,8 +1,9 @@
 # models/state.py
-from pydantic import BaseModel
+# Internal workflow types - plain dataclasses, no validation overhead.
+# API request/response schemas stay Pydantic (models/project.py, routes).
+from dataclasses import dataclass, field
 from typing import Dict, Any, List, Optional
 from enum import Enum
-from datetime import datetime
 
 class AgentRole(str, Enum):
     PI = "Principal Investigator"
@@ -10,29 +11,42 @@ class AgentRole(str, Enum):
     ML_SPECIALIST = "ML Specialist"
     COMP_BIOLOGIST = "Computational Biologist"
 
-class AgentInput(BaseModel):
+@dataclass(slots=True)
+class AgentInput:
     agent: AgentRole
     analysis: str
     recommendation: str  # "Modify Existing" or "De Novo Design"
     confidence: float
     reasoning: List[str]
 
-class ProjectState(BaseModel):
+@dataclass(slots=True)
+class ProjectState:
     # Input
     text: str
     
     # Agent inputs (populated during workflow)
-    agent_inputs: List[AgentInput] = []
+    agent_inputs: List[AgentInput] = field(default_factory=list)
     
     # Final outputs (API response format)
-    extracted_data: Dict[str, Any] = {}
-    strategy: Dict[str, Any] = {}
+    extracted_data: Dict[str, Any] = field(default_factory=dict)
+    strategy: Dict[str, Any] = field(default_factory=dict)
     status: str = "started"
     error: str = ""
     
     # Internal workflow tracking
     current_agent: Optional[AgentRole] = None
-    metadata: Dict[str, Any] = {}
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    
+    # (len(agent_inputs), rendered text) for render_prior_inputs
+    _prior_inputs: tuple = field(default=(0, ""), init=False, repr=False, compare=False)
+    
+    def render_prior_inputs(self) -> str:
+        """Team discussion so far, re-rendered only when agent_inputs has grown"""
+        count, rendered = self._prior_inputs
+        if count != len(self.agent_inputs):
+            rendered = "\n".join(f"{inp.agent.value}: {inp.analysis}" for inp in self.agent_inputs)
+            self._prior_inputs = (len(self.agent_inputs), rendered)
+        return rendered
 
 class EventType(str, Enum):
     STEP_START = "step_start"
@@ -40,13 +54,4 @@ class EventType(str, Enum):
     AGENT_THINKING = "agent_thinking"
     TOOL_USAGE = "tool_usage"
     DECISION_MADE = "decision_made"
-    ERROR = "error"
-
-class ProgressEvent(BaseModel):
-    event_type: EventType
-    timestamp: datetime
-    step_name: str
-    agent_role: Optional[AgentRole] = None  # ← Changed from "agent" to "agent_role"
-    message: Optional[str] = None  # ← Add this field (used in virtual_lab)
-    progress: Optional[float] = None
-    details: Optional[Dict[str, Any]] = None
\ No newline at end of file
+    ERROR = "error"
\ No newline at end of file
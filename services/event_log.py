@@ -0,0 +1,67 @@
+# services/event_log.py
+import os
+import time
+from typing import Any, Dict, Iterator, List
+
+import orjson
+
+
+class EventLog:
+    """
+    Append-only NDJSON trace of every progress event, one file per project.
+
+    Sessions keep only the last few events; the full trace is written here
+    and read back on demand. A trace expires `ttl` seconds after it was last
+    written or touched, matching the session it belongs to; expired files are
+    swept at most every `sweep_every` seconds. Calls do blocking file I/O -
+    run them off the event loop.
+    """
+
+    def __init__(self, directory: str, ttl: int = 86400, sweep_every: int = 3600):
+        self.directory = directory
+        self.ttl = ttl
+        self.sweep_every = sweep_every
+        self._next_sweep = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, project_id: str, checkpoint: str, events: List[Dict[str, Any]]):
+        lines = b"".join(orjson.dumps({"checkpoint": checkpoint, **event}) + b"\n" for event in events)
+        with open(self._path(project_id), "ab") as f:
+            f.write(lines)
+        if time.monotonic() >= self._next_sweep:
+            self.sweep()
+
+    def touch(self, project_id: str):
+        """Restart a trace's TTL when its session is saved without new events"""
+        try:
+            os.utime(self._path(project_id))
+        except FileNotFoundError:
+            pass
+
+    def sweep(self):
+        """Delete traces whose session has expired"""
+        self._next_sweep = time.monotonic() + self.sweep_every
+        cutoff = time.time() - self.ttl
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".ndjson"):
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass  # Swept by another worker
+
+    def iter_lines(self, project_id: str) -> Iterator[bytes]:
+        """Yield the stored NDJSON lines (nothing if the project has no trace)"""
+        try:
+            f = open(self._path(project_id), "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            yield from f
+
+    def _path(self, project_id: str) -> str:
+        if os.path.basename(project_id) != project_id:
+            raise ValueError(f"Invalid project id: {project_id!r}")
+        return os.path.join(self.directory, f"{project_id}.ndjson")
@@ -1,21 +1,26 @@
-import PyPDF2
+import pypdfium2 as pdfium
 from docx import Document
-import io
+from typing import BinaryIO
+import threading
+
+# PDFium is not thread-safe - not even across separate documents - and
+# uploads are parsed on worker threads, so all PDFium calls go through this lock
+_PDFIUM_LOCK = threading.Lock()
 
 class FileParser:
     @staticmethod
-    def parse_file(file_content: bytes, filename: str) -> str:
-        """Parse uploaded file and return text content"""
+    def parse_file(file: BinaryIO, filename: str) -> str:
+        """Parse an uploaded file object and return text content"""
         
         file_extension = filename.split('.')[-1].lower()
         
         try:
             if file_extension == 'pdf':
-                return FileParser._parse_pdf(file_content)
+                return FileParser._parse_pdf(file)
             elif file_extension == 'docx':
-                return FileParser._parse_docx(file_content)
+                return FileParser._parse_docx(file)
             elif file_extension == 'txt':
-                return file_content.decode('utf-8')
+                return file.read().decode('utf-8')
             else:
                 raise ValueError(f"Unsupported file type: {file_extension}")
                 
@@ -23,25 +28,28 @@ class FileParser:
             raise ValueError(f"Error parsing file: {str(e)}")
     
     @staticmethod
-    def _parse_pdf(file_content: bytes) -> str:
+    def _parse_pdf(file: BinaryIO) -> str:
         """Extract text from PDF"""
-        pdf_file = io.BytesIO(file_content)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
+        # PDFium reads pages straight from the stream instead of a full in-memory copy
+        with _PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(file)
+            parts = []
+            try:
+                for page in pdf:
+                    textpage = page.get_textpage()
+                    parts.append(textpage.get_text_range())
+                    # Close explicitly so no handle is freed by the GC outside the lock
+                    textpage.close()
+                    page.close()
+            finally:
+                pdf.close()
         
-        return text.strip()
+        # Join once - repeated += is quadratic on long documents
+        return "\n".join(parts).strip()
     
     @staticmethod
-    def _parse_docx(file_content: bytes) -> str:
+    def _parse_docx(file: BinaryIO) -> str:
         """Extract text from DOCX"""
-        doc_file = io.BytesIO(file_content)
-        document = Document(doc_file)
-        
-        text = ""
-        for paragraph in document.paragraphs:
-            text += paragraph.text + "\n"
+        document = Document(file)
         
-        return text.strip()
\ No newline at end of file
+        return "\n".join(paragraph.text for paragraph in document.paragraphs).strip()
\ No newline at end of file
@@ -1,13 +1,52 @@
 #openai_service.py
 import openai
-from typing import Dict, Any
+import httpx
+from typing import Dict, Any, AsyncIterator, Optional, Tuple
+import asyncio
 import json
+import logging
 import re
+import orjson
 from pydantic import BaseModel
+from services.semantic_cache import SemanticCache
+
+logger = logging.getLogger(__name__)
+
+# Used by the regex fallback - compiled once at import
+_TIMELINE_RE = re.compile(r'(\d+)\s*(month|week|day)s?')
+_BUDGET_RE = re.compile(r'\$?(\d+(?:,\d+)*(?:\.\d+)?)\s*[km]?')
+
+def _cacheable(content: str, structured: bool) -> bool:
+    """A structured response that won't parse must not be cached - every similar prompt would hit it"""
+    if not structured:
+        return True
+    try:
+        orjson.loads(content)
+    except orjson.JSONDecodeError:
+        return False
+    return True
 
 class OpenAIService:
-    def __init__(self, api_key: str):
-        self.client = openai.OpenAI(api_key=api_key)
+    def __init__(self, api_key: str, semantic_cache: Optional[SemanticCache] = None, max_concurrency: int = 64):
+        # One pooled HTTP/2 client for the app's lifetime - no handshake per call
+        self._http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=1000, max_keepalive_connections=200),
+            http2=True,
+            timeout=httpx.Timeout(60.0, connect=10.0)
+        )
+        self.client = openai.AsyncOpenAI(api_key=api_key, http_client=self._http_client)
+        self._semaphore = asyncio.Semaphore(max_concurrency)  # Stay under rate limits
+        self.semantic_cache = semantic_cache
+    
+    async def aclose(self):
+        """Release pooled connections and persist the semantic cache (app shutdown)"""
+        await self._http_client.aclose()
+        if self.semantic_cache:
+            await asyncio.to_thread(self.semantic_cache.save)
+    
+    async def _create(self, **kwargs):
+        async with self._semaphore:
+            return await self.client.chat.completions.create(**kwargs)
     
     async def extract_project_data(self, text: str) -> Dict[str, Any]:
         """Extract structured data from project brief text"""
@@ -30,7 +69,7 @@ class OpenAIService:
         """
         
         try:
-            response = self.client.chat.completions.create(
+            response = await self._create(
                 model="gpt-4o-mini",  # Cost-effective for JSON extraction
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.1,  # Low temperature for consistent extraction
@@ -90,7 +129,7 @@ class OpenAIService:
         """
         
         try:
-            response = self.client.chat.completions.create(
+            response = await self._create(
                 model="gpt-4o-mini",
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.3,
@@ -109,8 +148,9 @@ class OpenAIService:
     
     def _fallback_extraction(self, text: str) -> Dict[str, Any]:
         """Regex-based fallback for data extraction"""
-        timeline_match = re.search(r'(\d+)\s*(month|week|day)s?', text.lower())
-        budget_match = re.search(r'\$?(\d+(?:,\d+)*(?:\.\d+)?)\s*[km]?', text.lower())
+        lowered = text.lower()
+        timeline_match = _TIMELINE_RE.search(lowered)
+        budget_match = _BUDGET_RE.search(lowered)
         
         return {
             "target": "SARS-CoV-2 spike protein",  # Default assumption
@@ -137,15 +177,106 @@ class OpenAIService:
             "alternatives": []
         }
     
-    async def chat_completion(self, prompt: str) -> str:
+    async def chat_completion(self, prompt: str, cache_scope: str = "chat") -> str:
         """Simple chat completion for agent discussions"""
+        return await self._complete(prompt, cache_scope)
+    
+    async def chat_completion_structured(self, prompt: str, schema: Dict[str, Any], name: str,
+                                         cache_scope: Optional[str] = None, use_cache: bool = True) -> str:
+        """Chat completion constrained to a strict JSON schema - returns the raw JSON text"""
+        return await self._complete(
+            prompt,
+            (cache_scope or name) if use_cache else None,
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": name, "schema": schema, "strict": True}
+            }
+        )
+    
+    async def chat_completion_stream(self, prompt: str, schema: Optional[Dict[str, Any]] = None,
+                                     name: Optional[str] = None, use_cache: bool = True) -> AsyncIterator[str]:
+        """Stream completion text deltas as they're generated (optionally schema-constrained)"""
+        cache_scope = (name or "chat") if use_cache else None
+        embedding, cached = await self._cache_get(cache_scope, prompt)
+        if cached is not None:
+            yield cached
+            return
+        
+        options = {}
+        if schema is not None:
+            options["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": name, "schema": schema, "strict": True}
+            }
+        
+        parts = []
+        async with self._semaphore:
+            try:
+                stream = await self.client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.3,
+                    max_tokens=1000,
+                    stream=True,
+                    **options
+                )
+            except Exception as e:
+                raise Exception(f"Chat completion failed: {str(e)}")
+            # AsyncStream only closes its response when read to the end - if the consumer
+            # stops early (aclose), exiting this block closes it so generation stops too
+            async with stream:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                        yield parts[-1]
+        
+        content = "".join(parts).strip()
+        if embedding is not None and _cacheable(content, schema is not None):
+            self._cache_put(cache_scope, embedding, content)
+    
+    async def _cache_get(self, cache_scope: Optional[str], prompt: str) -> Tuple[Any, Optional[str]]:
+        """(prompt embedding, cached response) - embedding is None when caching is off"""
+        if self.semantic_cache is None or cache_scope is None:
+            return None, None
+        try:
+            embedding = await asyncio.to_thread(self.semantic_cache.embed, prompt)
+            return embedding, self.semantic_cache.get(cache_scope, embedding)
+        except Exception:
+            self._disable_cache()
+            return None, None
+    
+    def _cache_put(self, cache_scope: str, embedding: Any, content: str):
+        if self.semantic_cache is None:  # Disabled while the request was in flight
+            return
         try:
-            response = self.client.chat.completions.create(
+            self.semantic_cache.put(cache_scope, embedding, content)
+        except Exception:
+            self._disable_cache()
+    
+    def _disable_cache(self):
+        """The cache is an optimization - if it breaks (e.g. the embedding model can't
+        be loaded), log once and serve every request uncached rather than failing it"""
+        logger.exception("Semantic cache failed - continuing without it")
+        self.semantic_cache = None
+    
+    async def _complete(self, prompt: str, cache_scope: Optional[str], **options) -> str:
+        # Near-identical prompts (re-uploaded briefs) are answered from the semantic cache
+        embedding, cached = await self._cache_get(cache_scope, prompt)
+        if cached is not None:
+            return cached
+        
+        try:
+            response = await self._create(
                 model="gpt-4o-mini",
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.3,
-                max_tokens=1000
+                max_tokens=1000,
+                **options
             )
-            return response.choices[0].message.content.strip()
+            content = response.choices[0].message.content.strip()
         except Exception as e:
-            raise Exception(f"Chat completion failed: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Chat completion failed: {str(e)}")
+        
+        if embedding is not None and _cacheable(content, "response_format" in options):
+            self._cache_put(cache_scope, embedding, content)
+        return content
\ No newline at end of file
@@ -0,0 +1,188 @@
+# services/semantic_cache.py
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class _CacheEntry:
+    __slots__ = ("scope", "embedding", "response", "hits")
+
+    def __init__(self, scope: str, embedding: np.ndarray, response: str, hits: int = 0):
+        self.scope = scope
+        self.embedding = embedding
+        self.response = response
+        self.hits = hits
+
+
+class _Tier:
+    """Fixed-capacity set of entries with a lazily stacked (N, dim) embedding matrix"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.entries: "OrderedDict[int, _CacheEntry]" = OrderedDict()
+        self._ids: List[int] = []
+        self._scopes: Optional[np.ndarray] = None
+        self._matrix: Optional[np.ndarray] = None
+
+    def search(self, scope: str, embedding: np.ndarray) -> Optional[Tuple[int, float]]:
+        """Return (entry id, cosine similarity) of the closest entry in the same scope"""
+        if not self.entries:
+            return None
+        if self._matrix is None:
+            self._ids = list(self.entries)
+            self._scopes = np.array([self.entries[i].scope for i in self._ids])
+            self._matrix = np.stack([self.entries[i].embedding for i in self._ids])
+        sims = self._matrix @ embedding
+        sims[self._scopes != scope] = -1.0
+        best = int(sims.argmax())
+        return self._ids[best], float(sims[best])
+
+    def add(self, entry_id: int, entry: _CacheEntry):
+        self.entries[entry_id] = entry
+        self._matrix = None
+
+    def remove(self, entry_id: int) -> _CacheEntry:
+        self._matrix = None
+        return self.entries.pop(entry_id)
+
+
+class SemanticCache:
+    """
+    Two-tier semantic cache for LLM completions.
+
+    Prompts are embedded with a sentence-transformers model and a lookup hits
+    when the cosine similarity to a stored prompt in the same scope reaches
+    `threshold`. Scopes keep callers whose prompts share most of their text
+    (e.g. agents analysing the same brief) from answering for each other.
+    New entries go to mid-term memory (MTM, LRU-evicted). Every `promote_every`
+    lookups, frequently hit MTM entries are promoted to long-term memory
+    (LTM, LFU-evicted), which is persisted to `persist_path` so restarts stay warm.
+    """
+
+    def __init__(
+        self,
+        persist_path: Optional[str] = None,
+        model_name: str = "all-MiniLM-L6-v2",
+        threshold: float = 0.87,
+        mtm_size: int = 1000,
+        ltm_size: int = 1000,
+        promote_every: int = 50,
+        promote_min_hits: int = 2,
+    ):
+        self.persist_path = persist_path
+        self.model_name = model_name
+        self.threshold = threshold
+        self.promote_every = promote_every
+        self.promote_min_hits = promote_min_hits
+        self.mtm = _Tier(mtm_size)
+        self.ltm = _Tier(ltm_size)
+        self._model: Any = None  # SentenceTransformer, imported and loaded on first use
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # Promotion threads and the shutdown save may overlap
+        self._next_id = 0
+        self._lookups = 0
+        self._load()
+
+    def embed(self, prompt: str) -> np.ndarray:
+        """Normalized prompt embedding - CPU bound, run off the event loop"""
+        if self._model is None:
+            # Imported here - pulling in torch at module import would slow every worker start
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name)
+        return self._model.encode(prompt, normalize_embeddings=True).astype(np.float32)
+
+    def get(self, scope: str, embedding: np.ndarray) -> Optional[str]:
+        """Return the cached response for a similar prompt, or None on miss"""
+        with self._lock:
+            self._lookups += 1
+            if self._lookups % self.promote_every == 0:
+                self._promote()
+
+            best = None
+            for tier in (self.ltm, self.mtm):
+                match = tier.search(scope, embedding)
+                if match and match[1] >= self.threshold and (best is None or match[1] > best[2]):
+                    best = (tier, match[0], match[1])
+            if best is None:
+                return None
+
+            tier, entry_id, _ = best
+            entry = tier.entries[entry_id]
+            entry.hits += 1
+            if tier is self.mtm:
+                tier.entries.move_to_end(entry_id)
+            return entry.response
+
+    def put(self, scope: str, embedding: np.ndarray, response: str):
+        """Store a fresh completion in mid-term memory"""
+        with self._lock:
+            if len(self.mtm.entries) >= self.mtm.capacity:
+                self.mtm.remove(next(iter(self.mtm.entries)))  # Least recently used
+            self.mtm.add(self._new_id(), _CacheEntry(scope, embedding, response))
+
+    def save(self):
+        """Persist long-term memory to disk"""
+        if not self.persist_path:
+            return
+        # Saves are serialized so an older snapshot never lands last, and each
+        # writes its own temp file so saves from other workers can't interleave
+        with self._save_lock:
+            with self._lock:
+                payload = [
+                    {
+                        "scope": entry.scope,
+                        "embedding": entry.embedding.tolist(),
+                        "response": entry.response,
+                        "hits": entry.hits
+                    }
+                    for entry in self.ltm.entries.values()
+                ]
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(os.path.abspath(self.persist_path)), suffix=".tmp"
+            )
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(payload, f)
+                os.replace(tmp_path, self.persist_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+    def _new_id(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    def _promote(self):
+        """Move frequently hit MTM entries into LTM, evicting the least frequently used"""
+        candidates = [
+            (entry_id, entry) for entry_id, entry in self.mtm.entries.items()
+            if entry.hits >= self.promote_min_hits
+        ]
+        if not candidates:
+            return
+        for entry_id, entry in candidates:
+            self.ltm.add(entry_id, self.mtm.remove(entry_id))
+        while len(self.ltm.entries) > self.ltm.capacity:
+            coldest = min(self.ltm.entries, key=lambda i: self.ltm.entries[i].hits)
+            self.ltm.remove(coldest)
+
+        if self.persist_path:
+            threading.Thread(target=self.save, daemon=True).start()
+
+    def _load(self):
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path) as f:
+                payload: List[Dict] = json.load(f)
+        except (OSError, ValueError):
+            return  # A corrupt cache file only costs a cold start
+        for item in payload[-self.ltm.capacity:]:
+            embedding = np.asarray(item["embedding"], dtype=np.float32)
+            entry = _CacheEntry(item["scope"], embedding, item["response"], item.get("hits", 0))
+            self.ltm.add(self._new_id(), entry)
@@ -0,0 +1,46 @@
+# services/session_store.py
+from typing import Any, Dict, Optional
+
+import msgpack
+from cachetools import TTLCache
+
+
+class SessionStore:
+    """
+    Project sessions keyed by project_id, expiring `ttl` seconds after their last write.
+
+    With `redis_url` set, sessions live in Redis so every uvicorn worker sees
+    the same state and worker memory stays flat. Without it they fall back to
+    a bounded in-process TTLCache (single worker / local dev), so abandoned
+    sessions are evicted rather than growing the heap. Either way values are
+    msgpack-encoded, so callers get a copy: mutate it, then `set` it back.
+    """
+
+    def __init__(self, redis_url: Optional[str] = None, ttl: int = 86400,
+                 prefix: str = "session:", max_local_sessions: int = 10000):
+        self.ttl = ttl
+        self.prefix = prefix
+        self._redis = None
+        self._local: "TTLCache[str, bytes]" = TTLCache(maxsize=max_local_sessions, ttl=ttl)
+        if redis_url:
+            import redis.asyncio as redis
+            self._redis = redis.from_url(redis_url)
+
+    async def get(self, project_id: str) -> Optional[Dict[str, Any]]:
+        """Return the session, or None if it never existed or has expired"""
+        if self._redis is not None:
+            raw = await self._redis.get(self.prefix + project_id)
+        else:
+            raw = self._local.get(project_id)
+        return msgpack.unpackb(raw) if raw is not None else None
+
+    async def set(self, project_id: str, session: Dict[str, Any]):
+        raw = msgpack.packb(session)
+        if self._redis is not None:
+            await self._redis.set(self.prefix + project_id, raw, ex=self.ttl)
+        else:
+            self._local[project_id] = raw
+
+    async def aclose(self):
+        if self._redis is not None:
+            await self._redis.aclose()
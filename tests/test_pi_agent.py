@@ -0,0 +1,69 @@
+# tests/test_pi_agent.py
+import asyncio
+
+import ijson
+
+from agents.pi_agent import PIAgent, _DeltaReader, parse_failures
+from models.state import ProjectState
+
+STRATEGY_JSON = (
+    '{"title": "De Novo Design", "rationale": [{"icon": "Clock", "label": "Timeline Match", '
+    '"description": "Twelve months allows it"}], "candidates": [], "confidence": 0.85, "alternatives": []}'
+)
+
+
+def _token_deltas(text, size=3):
+    """Split like OpenAI stream deltas - a few characters each, with an empty one mid-stream"""
+    async def deltas():
+        for i in range(0, len(text), size):
+            yield text[i:i + size]
+            if i == size:
+                yield ""
+    return deltas()
+
+
+class _StreamingService:
+    def __init__(self, text):
+        self.text = text
+        self.structured_calls = 0
+
+    def chat_completion_stream(self, prompt, schema=None, name=None, use_cache=True):
+        return _token_deltas(self.text)
+
+    async def chat_completion_structured(self, *args, **kwargs):
+        self.structured_calls += 1
+        return self.text
+
+
+def test_delta_reader_feeds_ijson_token_deltas():
+    async def parse():
+        reader = _DeltaReader(_token_deltas(STRATEGY_JSON))
+        return dict([kv async for kv in ijson.kvitems_async(reader, "", use_float=True)])
+
+    fields = asyncio.run(parse())
+    assert fields["title"] == "De Novo Design"
+    assert fields["confidence"] == 0.85
+
+
+def test_delta_reader_honours_read_size():
+    async def read_all():
+        reader = _DeltaReader(_token_deltas("abcdefgh", size=5))
+        assert await reader.read(0) == b""
+        return [await reader.read(2) for _ in range(5)]
+
+    assert asyncio.run(read_all()) == [b"ab", b"cd", b"e", b"fg", b"h"]
+
+
+def test_synthesize_strategy_streams_fields_without_retry():
+    service = _StreamingService(STRATEGY_JSON)
+    fields = []
+    retries_before = parse_failures["strategy_retry"]
+
+    strategy = asyncio.run(PIAgent(service).synthesize_strategy(
+        ProjectState(text="brief"), on_field=lambda key, value: fields.append(key)
+    ))
+
+    assert strategy["title"] == "De Novo Design"
+    assert service.structured_calls == 0
+    assert parse_failures["strategy_retry"] == retries_before
+    assert fields == ["title", "rationale", "candidates", "confidence", "alternatives"]